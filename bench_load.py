@@ -0,0 +1,59 @@
+# bench_load.py
+#
+# Small load generator for comparing process models (e.g. a single uvicorn
+# process vs. gunicorn with gunicorn.conf.py) on the same box.
+#
+# Usage: python bench_load.py <url> [requests] [concurrency]
+#   python bench_load.py http://localhost:8000/claims/CUST-1 2000 64
+
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+URL = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8000/claim_media"
+TOTAL = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+CONCURRENCY = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+
+
+async def worker(client: httpx.AsyncClient, queue: asyncio.Queue, latencies: list, errors: list):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        start = time.perf_counter()
+        try:
+            response = await client.get(URL)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except Exception as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def main():
+    queue = asyncio.Queue()
+    for i in range(TOTAL):
+        queue.put_nowait(i)
+
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(client, queue, latencies, errors) for _ in range(CONCURRENCY)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"--- {TOTAL} requests to {URL}, concurrency {CONCURRENCY} ---")
+    print(f"  Throughput: {TOTAL / elapsed:.1f} req/s")
+    print(f"  p50:        {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"  p95:        {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+    print(f"  p99:        {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+    print(f"  Errors:     {len(errors)}")
+    print("\n--- Done ---")
+
+
+asyncio.run(main())
@@ -0,0 +1,128 @@
+# bench_serialization.py
+#
+# Microbenchmark for the response serialization path of the read endpoints.
+# Requests go through the real FastAPI routes (response_model validation,
+# jsonable_encoder, response class) with Supabase stubbed out to return
+# rows shaped like PostgREST's, i.e. dates and times as strings.
+#
+# Each route is measured twice: with the app's ORJSONResponse default, and
+# with the routes rebuilt on FastAPI's stock JSONResponse.
+#
+# Usage: python bench_serialization.py [claims_per_customer] [repeats]
+
+import os
+import sys
+import timeit
+import uuid
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "bench.bench.bench")
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import APIRoute, request_response
+from fastapi.testclient import TestClient
+
+import main
+
+CLAIMS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+REPEATS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+
+def make_tables(n: int) -> dict:
+    """Builds claim/media/car/... rows the way PostgREST returns them (all JSON types)."""
+    claims, media = [], []
+    for i in range(n):
+        claim_id = f"CL-{uuid.uuid4()}"
+        claims.append({
+            "claim_id": claim_id,
+            "policy_id": "POL-1",
+            "customer_id": "CUST-1",
+            "date_of_incident": f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            "incident_time": f"{i % 24:02d}:{i % 60:02d}:00",
+            "incident_location": "221B Baker Street, London",
+            "description": "Rear bumper dented in a parking lot collision.",
+            "status": "active",
+            "repair_shop_id_done": None,
+        })
+        for j in range(4):
+            media.append({
+                "media_id": i * 4 + j,
+                "claim_id": claim_id,
+                "uploaded_by_user_id": 7,
+                "storage_path": f"claims/{claim_id}/{uuid.uuid4()}.jpg",
+                "description": "front left",
+                "quality_score": 0.8,
+            })
+    return {
+        "claim": claims,
+        "claim_media": media,
+        "car": [{"car_id": "CAR-1", "customer_id": "CUST-1", "make": "Toyota", "model": "Corolla"}],
+        "policy": [{"policy_id": "POL-1", "car_id": "CAR-1", "policy_number": "PN-1"}],
+        "customer": [{"customer_id": "CUST-1", "name": "Jane Doe"}],
+        "repair_shop": [],
+    }
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+        self.count = len(data)
+
+
+class FakeQuery:
+    """Just enough of the postgrest query builder for the read endpoints."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        # /claim/{claim_id} filters on the first claim; everything else returns the full table.
+        if column == "claim_id":
+            return FakeQuery([row for row in self.rows if row.get("claim_id") == value])
+        return self
+
+    def execute(self):
+        return FakeResponse(self.rows)
+
+
+class FakeSupabase:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def table(self, name):
+        return FakeQuery(self.tables[name])
+
+
+def use_response_class(response_class):
+    """Rebuilds every route's ASGI handler with the given response class."""
+    for route in main.app.routes:
+        if isinstance(route, APIRoute):
+            route.response_class = response_class
+            route.app = request_response(route.get_route_handler())
+
+
+tables = make_tables(CLAIMS)
+main.supabase = FakeSupabase(tables)
+client = TestClient(main.app)
+
+ROUTES = [
+    ("/claims/{customer_id} (response_model)", "/claims/CUST-1"),
+    ("/claim_car/{customer_id} (no response_model)", "/claim_car/CUST-1"),
+    ("/claim/{claim_id}", f"/claim/{tables['claim'][0]['claim_id']}"),
+]
+
+print(f"--- {CLAIMS} claims, {len(tables['claim_media'])} photos, best of {REPEATS} runs ---")
+for label, url in ROUTES:
+    print(f"\n{label}")
+    timings = {}
+    for name, response_class in [("JSONResponse", JSONResponse), ("ORJSONResponse", ORJSONResponse)]:
+        use_response_class(response_class)
+        assert client.get(url).status_code == 200
+        timings[name] = min(timeit.repeat(lambda: client.get(url), number=1, repeat=REPEATS))
+        print(f"  {name:15} {timings[name] * 1000:8.2f} ms")
+    print(f"  speedup         {timings['JSONResponse'] / timings['ORJSONResponse']:8.2f}x")
+
+print("\n--- Done ---")
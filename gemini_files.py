@@ -0,0 +1,106 @@
+# gemini_files.py
+#
+# Registry of images uploaded through the Gemini file API, so repeat
+# analyses of a claim reference the uploaded files instead of re-sending
+# every image inline in the prompt.
+
+import hashlib
+import io
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import google.generativeai as genai
+
+# Gemini keeps uploaded files for 48 hours; assume that when a handle has no expiry.
+DEFAULT_FILE_LIFETIME = timedelta(hours=48)
+# Re-upload a bit before expiry so a handle doesn't lapse mid-request.
+EXPIRY_MARGIN = timedelta(minutes=int(os.getenv("GEMINI_FILE_EXPIRY_MARGIN_MINUTES", "10")))
+
+
+def genai_upload_file(image_bytes: bytes, mime_type: str, display_name: str):
+    """Uploads image bytes through the genai file API and returns the file handle."""
+    return genai.upload_file(io.BytesIO(image_bytes), mime_type=mime_type, display_name=display_name)
+
+
+class GeminiFileRegistry:
+    """
+    Maps image content (by SHA-256) and claim_media ids to uploaded file handles.
+
+    upload_file(image_bytes, mime_type, display_name) must return an object with
+    an optional `expiration_time` datetime; pass a fake to use this without the
+    real file API.
+    """
+
+    max_files = 5000
+
+    def __init__(self, upload_file=genai_upload_file, expiry_margin: timedelta = EXPIRY_MARGIN):
+        self._upload_file = upload_file
+        self._expiry_margin = expiry_margin
+        self._by_hash = {}  # sha256 -> (handle, expires_at)
+        self._hash_by_media_id = {}  # media_id -> sha256
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.hits = 0
+
+    @staticmethod
+    def content_hash(image_bytes: bytes) -> str:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def _valid_handle(self, content_hash: Optional[str]):
+        entry = self._by_hash.get(content_hash)
+        if entry is None:
+            return None
+        handle, expires_at = entry
+        if datetime.now(timezone.utc) + self._expiry_margin >= expires_at:
+            del self._by_hash[content_hash]
+            return None
+        return handle
+
+    def lookup(self, media_id):
+        """Returns a still-valid handle for a claim_media id, or None."""
+        with self._lock:
+            handle = self._valid_handle(self._hash_by_media_id.get(media_id))
+            if handle is not None:
+                self.hits += 1
+            return handle
+
+    def get_or_upload(self, image_bytes: bytes, mime_type: str, media_id=None):
+        """Returns a valid handle for these bytes, uploading them if needed."""
+        content_hash = self.content_hash(image_bytes)
+        with self._lock:
+            if media_id is not None:
+                self._hash_by_media_id[media_id] = content_hash
+            handle = self._valid_handle(content_hash)
+            if handle is not None:
+                self.hits += 1
+                return handle
+
+        # Upload outside the lock; a concurrent upload of the same bytes is harmless.
+        handle = self._upload_file(image_bytes, mime_type, f"claim-image-{content_hash[:16]}")
+        expires_at = getattr(handle, "expiration_time", None) or datetime.now(timezone.utc) + DEFAULT_FILE_LIFETIME
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+
+        with self._lock:
+            if len(self._by_hash) >= self.max_files:
+                self._prune()
+            self._by_hash[content_hash] = (handle, expires_at)
+            if media_id is not None:
+                self._hash_by_media_id[media_id] = content_hash
+            self.uploads += 1
+        return handle
+
+    def _prune(self):
+        now = datetime.now(timezone.utc)
+        self._by_hash = {h: entry for h, entry in self._by_hash.items() if entry[1] > now}
+        live = set(self._by_hash)
+        self._hash_by_media_id = {m: h for m, h in self._hash_by_media_id.items() if h in live}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._by_hash), "uploads": self.uploads, "hits": self.hits}
+
+
+file_registry = GeminiFileRegistry()
@@ -0,0 +1,57 @@
+# gunicorn.conf.py
+#
+# Production process model: several uvicorn workers under gunicorn, with the
+# app preloaded in the master so workers fork from an already-imported app.
+#
+#   gunicorn main:app -c gunicorn.conf.py
+#
+# Every setting can be overridden through the environment.
+
+import multiprocessing
+import os
+
+# --- Binding ---
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# Proxies whose X-Forwarded-For is trusted for the client address the rate
+# limiter keys on (with ANALYZE_RATE_LIMIT_BY_ADDRESS). Only set this to the
+# platform's load balancer addresses; left at the default behind a proxy,
+# every caller appears as the proxy.
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+backlog = int(os.getenv("GUNICORN_BACKLOG", "2048"))
+
+# --- Workers ---
+worker_class = "uvicorn.workers.UvicornWorker"
+# The idempotency store, summary cache and rate limit buckets are only
+# shared between workers through Redis, so without REDIS_URL run one worker.
+default_workers = min(multiprocessing.cpu_count() * 2 + 1, 8) if os.getenv("REDIS_URL") else 1
+workers = int(os.getenv("WEB_CONCURRENCY", str(default_workers)))
+# The preloaded app reads this to split the analysis concurrency limit across workers.
+os.environ["WEB_CONCURRENCY"] = str(workers)
+preload_app = True
+
+# --- Timeouts ---
+# Keep-alive should be longer than the load balancer's idle timeout.
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "75"))
+# Gemini analyses and multi-photo uploads can take well over gunicorn's 30s default.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# On SIGTERM, workers stop accepting and get this long to drain in-flight
+# uploads and analyses before they are killed.
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "90"))
+
+# Recycle workers now and then to bound memory growth from PIL buffers.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    """Give each worker its own Supabase, Postgres and Gemini clients."""
+    import main
+    import photo_agent
+
+    main.init_clients()
+    photo_agent.init_clients()
+    server.log.info(f"Worker {worker.pid}: clients initialized.")
+
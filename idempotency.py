@@ -0,0 +1,176 @@
+# idempotency.py
+#
+# Idempotency-Key support for write endpoints that mobile clients retry.
+# The first request with a key runs normally and its response is stored;
+# replays get the stored response, and duplicates that arrive while the
+# first one is still running wait for it instead of running again.
+# A key reused with a different request payload is rejected with 422.
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+
+from cachetools import TTLCache
+from fastapi import HTTPException
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+# How long a duplicate waits on a request running in another worker.
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+REDIS_URL = os.getenv("REDIS_URL")
+
+
+def request_fingerprint(fields: dict, files: list) -> str:
+    """
+    Hashes a request's form fields and the size and digest of each uploaded
+    file (given as (filename, bytes) pairs), so replays can be told apart
+    from a key reused for a different submission.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(fields, sort_keys=True, default=str).encode())
+    for filename, content in files:
+        digest.update(f"|{filename}:{len(content)}:{hashlib.sha256(content).hexdigest()}".encode())
+    return digest.hexdigest()
+
+
+def _check_fingerprint(stored: str, fingerprint: str):
+    if stored != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request."
+        )
+
+
+class LocalIdempotencyStore:
+    """
+    In-process store of completed responses, evicted after ttl seconds.
+    Keys are only deduplicated within one worker process; set REDIS_URL to
+    share them when running several workers.
+    """
+
+    def __init__(self, ttl: int, maxsize: int):
+        self._completed = TTLCache(maxsize=maxsize, ttl=ttl)  # key -> (fingerprint, response)
+        self._in_flight = {}  # key -> (fingerprint, asyncio.Future of the running request)
+        self._lock = threading.Lock()
+
+    async def run(self, key: str, fingerprint: str, handler):
+        """
+        Runs handler() once per key and returns (result, replayed).
+        Failed requests are not stored, so the client can retry them.
+        """
+        with self._lock:
+            if key in self._completed:
+                stored_fingerprint, result = self._completed[key]
+                _check_fingerprint(stored_fingerprint, fingerprint)
+                return result, True
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                future = asyncio.get_running_loop().create_future()
+                self._in_flight[key] = (fingerprint, future)
+
+        if in_flight is not None:
+            in_flight_fingerprint, in_flight_future = in_flight
+            _check_fingerprint(in_flight_fingerprint, fingerprint)
+            # shield() so a client disconnecting doesn't cancel the original request.
+            return await asyncio.shield(in_flight_future), True
+
+        try:
+            result = await handler()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when no duplicate is waiting
+            raise
+        else:
+            with self._lock:
+                self._completed[key] = (fingerprint, result)
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"stored": len(self._completed), "in_flight": len(self._in_flight)}
+
+
+class RedisIdempotencyStore:
+    """
+    Store shared by every worker through Redis. The first request takes a
+    lock key (SET NX); duplicates in any worker poll until the stored
+    response appears, or take over if the first request failed.
+    """
+
+    poll_interval = 0.2
+
+    def __init__(self, url: str, ttl: int, lock_seconds: int):
+        self.url = url
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self._client = None
+
+    @property
+    def client(self):
+        # Created on first use, inside the worker process and its event loop.
+        if self._client is None:
+            import redis.asyncio  # Optional dependency, only needed for the shared backend
+            self._client = redis.asyncio.Redis.from_url(self.url)
+        return self._client
+
+    async def _stored(self, key: str, fingerprint: str):
+        raw = await self.client.get(f"idempotency:{key}:response")
+        if raw is None:
+            return None
+        stored = json.loads(raw)
+        _check_fingerprint(stored["fingerprint"], fingerprint)
+        return stored["response"]
+
+    async def run(self, key: str, fingerprint: str, handler):
+        """
+        Runs handler() once per key across all workers and returns (result, replayed).
+        Failed requests are not stored, so the client can retry them.
+        """
+        lock_key = f"idempotency:{key}:lock"
+        deadline = asyncio.get_running_loop().time() + self.lock_seconds
+        while True:
+            stored = await self._stored(key, fingerprint)
+            if stored is not None:
+                return stored, True
+
+            if await self.client.set(lock_key, fingerprint, nx=True, ex=self.lock_seconds):
+                break
+
+            holder = await self.client.get(lock_key)
+            if holder is not None:
+                _check_fingerprint(holder.decode(), fingerprint)
+            if asyncio.get_running_loop().time() > deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress.")
+            await asyncio.sleep(self.poll_interval)
+
+        try:
+            result = await handler()
+            await self.client.set(
+                f"idempotency:{key}:response",
+                json.dumps({"fingerprint": fingerprint, "response": result}, default=str),
+                ex=self.ttl,
+            )
+            return result, False
+        finally:
+            await self.client.delete(lock_key)
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+def create_idempotency_store():
+    if REDIS_URL:
+        return RedisIdempotencyStore(REDIS_URL, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_LOCK_SECONDS)
+    return LocalIdempotencyStore(IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_KEYS)
+
+
+idempotency_store = create_idempotency_store()
@@ -1,20 +1,30 @@
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 import os
-from fastapi import FastAPI, UploadFile, File, HTTPException,Form
+from fastapi import FastAPI, UploadFile, File, HTTPException,Form,Header
 from supabase import create_client, Client
 from pydantic import BaseModel,ConfigDict
 import uuid 
-from typing import List,Optional
+from typing import List,Optional,Union
 from datetime import date, time,datetime
 import json
+import threading
+from contextlib import contextmanager
+from cachetools import TTLCache
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from photo_agent import router as photo_agent_router
+from idempotency import idempotency_store, request_fingerprint
+from image_quality import assess_images
 
 # Load environment variables from .env
 load_dotenv()
 
-app = FastAPI()
+# orjson serializes the raw Supabase rows (dates, times, nested dicts)
+# several times faster than the default jsonable_encoder + json.dumps path.
+app = FastAPI(default_response_class=ORJSONResponse)
 app.include_router(photo_agent_router)
 
 origins = [
@@ -33,6 +43,22 @@ app.add_middleware(
     allow_headers=["*"],       # Allow all headers
 )
 
+# Opt-in response compression: RESPONSE_COMPRESSION=gzip|brotli.
+# Bodies smaller than COMPRESSION_MIN_SIZE bytes are sent uncompressed.
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "").lower()
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+if RESPONSE_COMPRESSION == "brotli":
+    try:
+        from brotli_asgi import BrotliMiddleware
+        # Falls back to gzip for clients that don't accept br.
+        app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+    except ImportError:
+        print("WARNING: brotli-asgi is not installed, falling back to gzip compression.")
+        app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+elif RESPONSE_COMPRESSION == "gzip":
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
 URL = os.getenv("SUPABASE_URL")
 KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
@@ -42,23 +68,171 @@ PASSWORD = os.getenv("supabase_password")
 HOST = os.getenv("HOST")
 PORT = os.getenv("PORT")
 DBNAME = os.getenv("DBNAME")
+# PORT is also the HTTP port on Railway, so allow the DB port to be set separately.
+DB_PORT = os.getenv("DB_PORT", PORT)
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
 
 
 
+supabase: Client = None
+db_pool = None
+
 # Initialize Supabase client
+def init_clients():
+    """
+    (Re)creates this module's network clients. Called at import, and again in
+    each gunicorn worker after fork so workers don't share the master's sockets.
+    """
+    global supabase, db_pool
+    supabase = create_client(URL, KEY)
+    db_pool = None  # Reopened lazily by get_db_pool() in the worker
+
 try:
-    supabase: Client = create_client(URL, KEY)
+    init_clients()
     print("Supabase client initialized.")
 except Exception as e:
     print(f"Error initializing Supabase client: {e}")
     exit(1)
 
-# Initialize FastAPI app
+# Direct Postgres pool for grouped/aggregate queries PostgREST can't express.
+# Opened lazily so the app still starts if only the Supabase keys are set.
+_db_pool_lock = threading.Lock()
+# ThreadedConnectionPool.getconn() raises instead of waiting when every
+# connection is in use, so callers queue here for a free slot first.
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+def get_db_pool() -> ThreadedConnectionPool:
+    global db_pool
+    with _db_pool_lock:
+        if db_pool is None:
+            db_pool = ThreadedConnectionPool(
+                1, DB_POOL_MAX,
+                user=USER, password=PASSWORD, host=HOST, port=DB_PORT, dbname=DBNAME
+            )
+        return db_pool
+
+@contextmanager
+def db_cursor():
+    """Borrows a pooled connection and yields a cursor, returning the connection afterwards."""
+    pool = get_db_pool()
+    with _db_pool_slots:
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+
+# Short-lived cache for /customers/{customer_id}/summary.
+# Entries are dropped on claim/media writes, the TTL only bounds staleness
+# from writes made outside this app. With REDIS_URL set the cache lives in
+# Redis, so an invalidation in one worker is seen by all of them.
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", "30"))
+SUMMARY_CACHE_PREFIX = "summary:"
+REDIS_URL = os.getenv("REDIS_URL")
+# Invalidations run inside the async write endpoints, so a slow Redis must
+# fail fast into the warning path instead of stalling the worker.
+SUMMARY_CACHE_REDIS_TIMEOUT = float(os.getenv("SUMMARY_CACHE_REDIS_TIMEOUT", "0.5"))
+summary_cache = TTLCache(maxsize=1024, ttl=SUMMARY_CACHE_TTL)
+_summary_cache_lock = threading.Lock()
+summary_redis = None
+
+if REDIS_URL:
+    import redis
+    # redis-py reconnects after fork, so one client per module is enough.
+    summary_redis = redis.Redis.from_url(
+        REDIS_URL,
+        socket_timeout=SUMMARY_CACHE_REDIS_TIMEOUT,
+        socket_connect_timeout=SUMMARY_CACHE_REDIS_TIMEOUT,
+    )
+
+def get_cached_summary(customer_id: str):
+    if summary_redis is not None:
+        try:
+            raw = summary_redis.get(SUMMARY_CACHE_PREFIX + customer_id)
+            return CustomerSummary.model_validate_json(raw) if raw else None
+        except Exception as e:
+            print(f"WARNING: Summary cache read failed: {e}")
+            return None
+    with _summary_cache_lock:
+        return summary_cache.get(customer_id)
+
+def cache_summary(customer_id: str, summary):
+    if summary_redis is not None:
+        try:
+            summary_redis.set(SUMMARY_CACHE_PREFIX + customer_id, summary.model_dump_json(), ex=SUMMARY_CACHE_TTL)
+        except Exception as e:
+            print(f"WARNING: Summary cache write failed: {e}")
+        return
+    with _summary_cache_lock:
+        summary_cache[customer_id] = summary
+
+def invalidate_customer_summary(*customer_ids):
+    customer_ids = [customer_id for customer_id in customer_ids if customer_id is not None]
+    if summary_redis is not None:
+        try:
+            if customer_ids:
+                summary_redis.delete(*[SUMMARY_CACHE_PREFIX + customer_id for customer_id in customer_ids])
+        except Exception as e:
+            # Not worth failing the write over; the TTL bounds how stale it gets.
+            print(f"WARNING: Summary cache invalidation failed: {e}")
+        return
+    with _summary_cache_lock:
+        for customer_id in customer_ids:
+            summary_cache.pop(customer_id, None)
+
+def clear_summary_cache():
+    if summary_redis is not None:
+        try:
+            keys = list(summary_redis.scan_iter(match=SUMMARY_CACHE_PREFIX + "*"))
+            if keys:
+                summary_redis.delete(*keys)
+        except Exception as e:
+            print(f"WARNING: Summary cache clear failed: {e}")
+        return
+    with _summary_cache_lock:
+        summary_cache.clear()
+
+def invalidate_claim_summary(claim_id: str):
+    """Drops the cached summary of whichever customer owns claim_id."""
+    try:
+        res = supabase.table("claim").select("customer_id").eq("claim_id", claim_id).execute()
+        invalidate_customer_summary(*[row["customer_id"] for row in res.data])
+    except Exception as e:
+        # If we can't tell whose summary is stale, drop them all.
+        print(f"WARNING: Could not resolve customer for claim {claim_id}, clearing summary cache: {e}")
+        clear_summary_cache()
 
 
 # This is the name of your bucket in Supabase Storage
 BUCKET_NAME = "claims-media" 
 
+# Explicit column projections for the read endpoints, so we only transfer
+# and serialize the columns the frontend actually uses.
+CLAIM_COLUMNS = "claim_id, policy_id, customer_id, date_of_incident, incident_time, incident_location, description, status, repair_shop_id_done"
+MEDIA_COLUMNS = "media_id, claim_id, uploaded_by_user_id, storage_path, description, quality_score"
+
+async def check_image_quality(files: List[UploadFile]) -> List[dict]:
+    """
+    Runs the ingest quality gate (in a process pool) on uploaded files and
+    rejects unusable ones with a 400 before anything is stored.
+    Returns one quality report per file. Files are rewound so they can be read again.
+    """
+    contents = [await file.read() for file in files]
+    reports = await assess_images(contents)
+
+    rejected = [f"{file.filename}: {report['reason']}" for file, report in zip(files, reports) if not report["usable"]]
+    if rejected:
+        raise HTTPException(status_code=400, detail=f"Unusable image(s): {'; '.join(rejected)}")
+
+    for file in files:
+        await file.seek(0)
+    return reports
+
 # Pydantic model for updating the title
 class PhotoUpdate(BaseModel):
     title: str
@@ -82,6 +256,35 @@ class ClaimResponse(BaseModel):
     incident_location: str
     description: Optional[str] = None
 
+# Read-side model for stored claims: every column is optional so a legacy
+# row with NULLs doesn't fail validation for the whole list.
+class ClaimRecord(BaseModel):
+    claim_id: str
+    policy_id: Optional[str] = None
+    customer_id: Optional[str] = None
+    date_of_incident: Optional[date] = None
+    incident_time: Optional[time] = None
+    incident_location: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[str] = None
+    repair_shop_id_done: Optional[Union[int, str]] = None
+
+class MediaRecord(BaseModel):
+    media_id: int
+    claim_id: Optional[str] = None
+    uploaded_by_user_id: Optional[int] = None
+    storage_path: Optional[str] = None
+    description: Optional[str] = None
+    quality_score: Optional[float] = None
+
+class CustomerSummary(BaseModel):
+    customer_id: str
+    total_claims: int
+    claims_by_status: dict[str, int]
+    media_counts: dict[str, int]
+    latest_incident_date: Optional[date] = None
+    cars: List[dict]
+
 class ClaimUpdate(BaseModel):
     policy_id: Optional[str] = None
     customer_id: Optional[str] = None
@@ -93,29 +296,29 @@ class ClaimUpdate(BaseModel):
 # --- 2. The 4 API Endpoints ---
 
 ### API 1: View (Read) All Photos
-@app.get("/claim_media")
+@app.get("/claim_media", response_model=List[MediaRecord])
 def get_all_media():
     """Fetches all media records from the claim_media table."""
     try:
-        response = supabase.table("claim_media").select("*").execute()
+        response = supabase.table("claim_media").select(MEDIA_COLUMNS).execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-@app.get("/claims/media/{media_id}")
+@app.get("/claims/media/{media_id}", response_model=List[MediaRecord])
 def get_media_for_claim(media_id : int):
     """Fetches all media records for a specific claim_id."""
     try:
         # This is how you filter by a foreign key
-        response = supabase.table("claim_media").select("*").eq("media_id", media_id).execute()
+        response = supabase.table("claim_media").select(MEDIA_COLUMNS).eq("media_id", media_id).execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-@app.get("/claims/{customer_id}")
+@app.get("/claims/{customer_id}", response_model=List[ClaimRecord])
 def get_media_for_claim(customer_id : str):
     try:
-        response = supabase.table("claim").select("*").eq("customer_id", customer_id).execute()
+        response = supabase.table("claim").select(CLAIM_COLUMNS).eq("customer_id", customer_id).execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -123,34 +326,35 @@ def get_media_for_claim(customer_id : str):
 @app.get("/claim/{claim_id}")
 def get_media_for_claim(claim_id : str):
     try:
-        policy_id_res = supabase.table("claim").select("policy_id").eq("claim_id", claim_id).execute()
-        policy_id = None
-        if(policy_id_res.data):
-            policy_id = policy_id_res.data[0]['policy_id']
+        # Fetch the claim row once; policy, customer and repair shop ids all come from it.
+        claim_response = supabase.table("claim").select(CLAIM_COLUMNS).eq("claim_id", claim_id).execute()
+        if not claim_response.data:
+            return []
+
+        claim_row = claim_response.data[0]
+        policy_id = claim_row.get("policy_id")
+        cust_id = claim_row.get("customer_id")
+        shop_id = claim_row.get("repair_shop_id_done")
 
-        car_id_res = supabase.table("policy").select("car_id").eq("policy_id", policy_id).execute()
+        policy_res = supabase.table("policy").select("car_id, policy_number").eq("policy_id", policy_id).execute()
         car_id = None
-        if(car_id_res.data):
-            car_id = car_id_res.data[0]['car_id']
-        
-        cust_id_res = supabase.table("claim").select("customer_id").eq("claim_id", claim_id).execute()
-        cust_id=None
-        if(cust_id_res.data):
-            cust_id = cust_id_res.data[0]['customer_id']
-
-        shop_id_res = cust_id_res = supabase.table("claim").select("repair_shop_id_done").eq("claim_id", claim_id).execute()
-        shop_id=None
-        if(shop_id_res.data):
-            shop_id = shop_id_res.data[0]['repair_shop_id_done']
-        
-        pol_no = supabase.table("policy").select("policy_number").eq("policy_id", policy_id).execute()
+        pol_no = []
+        if(policy_res.data):
+            car_id = policy_res.data[0]['car_id']
+            pol_no = [{"policy_number": policy_res.data[0]['policy_number']}]
 
-        shop_response = supabase.table("repair_shop").select("*").eq("repair_shop_id", shop_id).execute()
+        shop_response = supabase.table("repair_shop").select("*").eq("repair_shop_id", shop_id).execute() if shop_id is not None else None
         cust_response = supabase.table("customer").select("*").eq("customer_id", cust_id).execute()
-        car_response = supabase.table("car").select("*").eq("car_id", car_id).execute()
-        claim_response = supabase.table("claim").select("*").eq("claim_id", claim_id).execute()
-        media_response = supabase.table("claim_media").select("*").eq("claim_id", claim_id).execute()
-        return claim_response.data + media_response.data + car_response.data + cust_response.data + shop_response.data + pol_no.data
+        car_response = supabase.table("car").select("*").eq("car_id", car_id).execute() if car_id is not None else None
+        media_response = supabase.table("claim_media").select(MEDIA_COLUMNS).eq("claim_id", claim_id).execute()
+        return (
+            claim_response.data
+            + media_response.data
+            + (car_response.data if car_response else [])
+            + cust_response.data
+            + (shop_response.data if shop_response else [])
+            + pol_no
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -158,13 +362,67 @@ def get_media_for_claim(claim_id : str):
 @app.get("/claim_car/{customer_id}")
 def get_media_for_claim(customer_id : str):
     try:
-        claim_response = supabase.table("claim").select("*").eq("customer_id", customer_id).execute()
+        claim_response = supabase.table("claim").select(CLAIM_COLUMNS).eq("customer_id", customer_id).execute()
         car_response = supabase.table("car").select("*").eq("customer_id", customer_id).execute()
         return claim_response.data + car_response.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 
+@app.get("/customers/{customer_id}/summary", response_model=CustomerSummary)
+def get_customer_summary(customer_id: str):
+    """
+    Dashboard summary for a customer: claim counts by status, media count per
+    claim, latest incident date and cars. Counts are computed in Postgres with
+    grouped queries so the payload doesn't grow with the claim history.
+    """
+    cached = get_cached_summary(customer_id)
+    if cached is not None:
+        return cached
+
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                """
+                SELECT COALESCE(status, 'unknown'), COUNT(*), MAX(date_of_incident)
+                FROM claim
+                WHERE customer_id = %s
+                GROUP BY 1
+                """,
+                (customer_id,)
+            )
+            status_rows = cur.fetchall()
+
+            cur.execute(
+                """
+                SELECT c.claim_id, COUNT(m.media_id)
+                FROM claim c
+                LEFT JOIN claim_media m ON m.claim_id = c.claim_id
+                WHERE c.customer_id = %s
+                GROUP BY c.claim_id
+                """,
+                (customer_id,)
+            )
+            media_rows = cur.fetchall()
+
+        car_response = supabase.table("car").select("*").eq("customer_id", customer_id).execute()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    latest_dates = [latest for _, _, latest in status_rows if latest is not None]
+    summary = CustomerSummary(
+        customer_id=customer_id,
+        total_claims=sum(count for _, count, _ in status_rows),
+        claims_by_status={status: count for status, count, _ in status_rows},
+        media_counts={claim_id: count for claim_id, count in media_rows},
+        latest_incident_date=max(latest_dates) if latest_dates else None,
+        cars=car_response.data,
+    )
+
+    cache_summary(customer_id, summary)
+    return summary
+
+
 @app.post("/claims", response_model=ClaimResponse)
 def create_claim(claim_data: ClaimCreate):
     try:
@@ -180,6 +438,8 @@ def create_claim(claim_data: ClaimCreate):
         
         if not response.data:
             raise HTTPException(status_code=500, detail="Failed to create claim.")
+
+        invalidate_customer_summary(claim_data.customer_id)
             
         # --- THIS IS THE FIX for the RETURN ---
         # We parse the data from Supabase (which also has date objects)
@@ -201,6 +461,9 @@ async def upload_multiple_media(
     #descriptions = ["","desp1"]
     db_entries = []
     uploaded_storage_paths = []
+
+    # Reject blank, tiny or non-image files before they reach storage
+    quality_reports = await check_image_quality(files)
     
 
     for index, file in enumerate(files):
@@ -226,7 +489,8 @@ async def upload_multiple_media(
                 "claim_id": claim_id,
                 "uploaded_by_user_id": uploaded_by_user_id,
                 "storage_path": file_path,
-                "description": description
+                "description": description,
+                "quality_score": quality_reports[index]["quality_score"]
             })
             # Keep track of uploaded files for potential rollback
             uploaded_storage_paths.append(file_path)
@@ -250,11 +514,13 @@ async def upload_multiple_media(
         response = supabase.table("claim_media").insert(db_entries).execute()
 
         try:
-            supabase.table("claim").update({"status": "active"}).eq("claim_id", claim_id).execute()
+            status_response = supabase.table("claim").update({"status": "active"}).eq("claim_id", claim_id).execute()
+            invalidate_customer_summary(*[row["customer_id"] for row in status_response.data])
         except Exception as e:
             # If this update fails, it's not a critical error.
             # The photos are still saved. We just log it.
             print(f"WARNING: Failed to update claim {claim_id} status to 'active': {e}")
+            invalidate_claim_summary(claim_id)
 
         return response.data
     
@@ -282,12 +548,64 @@ async def create_claim_and_upload_media(
     uploaded_by_user_id: int = Form(...),
     files: List[UploadFile] = File(...),
     descriptions: List[str] = Form(...),
+
+    # Optional: clients send the same key when retrying a timed-out submission
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
     """
     Creates a new claim AND uploads media in a single transaction.
     - Claim data is sent as individual form fields.
     - A claim is only created if at least one file is provided.
+    - With an Idempotency-Key header, retries return the original response
+      instead of creating a second claim.
     """
+    async def submit():
+        return await _create_claim_and_upload_media(
+            policy_id, customer_id, date_of_incident, incident_time, incident_location,
+            description, uploaded_by_user_id, files, descriptions
+        )
+
+    if not idempotency_key:
+        return await submit()
+
+    # Fingerprint the payload so a key reused for a different submission is rejected.
+    file_contents = []
+    for file in files:
+        file_contents.append((file.filename, await file.read()))
+        await file.seek(0)
+    fingerprint = request_fingerprint(
+        {
+            "policy_id": policy_id,
+            "customer_id": customer_id,
+            "date_of_incident": date_of_incident,
+            "incident_time": incident_time,
+            "incident_location": incident_location,
+            "description": description,
+            "uploaded_by_user_id": uploaded_by_user_id,
+            "descriptions": descriptions,
+        },
+        file_contents
+    )
+
+    # Scope keys per customer so two customers can't collide on the same key.
+    result, replayed = await idempotency_store.run(
+        f"full_submission:{customer_id}:{idempotency_key}", fingerprint, submit
+    )
+    if replayed:
+        return ORJSONResponse(result, headers={"Idempotent-Replayed": "true"})
+    return result
+
+async def _create_claim_and_upload_media(
+    policy_id: str,
+    customer_id: str,
+    date_of_incident: date,
+    incident_time: time,
+    incident_location: str,
+    description: Optional[str],
+    uploaded_by_user_id: int,
+    files: List[UploadFile],
+    descriptions: List[str],
+):
     
     # --- 1. Validate Inputs (Unchanged) ---
     if not files:
@@ -324,7 +642,10 @@ async def create_claim_and_upload_media(
     except Exception as e: # Catches Pydantic validation errors
         raise HTTPException(status_code=422, detail=f"Invalid claim data: {str(e)}")
 
-    # --- 3. Process All Files (Upload to Storage) (Unchanged) ---
+    # --- 3. Process All Files (Upload to Storage) ---
+    # Reject blank, tiny or non-image files before they reach storage
+    quality_reports = await check_image_quality(files)
+
     new_claim_id = f"CL-{uuid.uuid4()}"
     uploaded_storage_paths = []
     db_media_entries = []
@@ -351,7 +672,8 @@ async def create_claim_and_upload_media(
                 "claim_id": new_claim_id,
                 "uploaded_by_user_id": uploaded_by_user_id,
                 "storage_path": file_path,
-                "description": description
+                "description": description,
+                "quality_score": quality_reports[index]["quality_score"]
             })
             
         except Exception as e:
@@ -378,6 +700,8 @@ async def create_claim_and_upload_media(
         media_response = supabase.table("claim_media").insert(db_media_entries).execute()
         if not media_response.data:
             raise Exception("Failed to insert media records.")
+
+        invalidate_customer_summary(customer_id)
         
         return {
             "claim": claim_response.data[0],
@@ -426,7 +750,7 @@ async def update_claim_and_media(
     
     # --- 1. Validate Claim Exists ---
     try:
-        existing_claim = supabase.table("claim").select("claim_id").eq("claim_id", claim_id).execute()
+        existing_claim = supabase.table("claim").select("claim_id, customer_id").eq("claim_id", claim_id).execute()
         if not existing_claim.data:
             raise HTTPException(status_code=404, detail="Claim not found.")
     except Exception as e:
@@ -476,7 +800,9 @@ async def update_claim_and_media(
         )
 
     # --- 3. Process New File Uploads (if any) ---
-    # (This section is unchanged)
+    # Reject blank, tiny or non-image files before they reach storage
+    quality_reports = await check_image_quality(new_files) if new_files else []
+
     newly_uploaded_storage_paths = []
     db_media_entries_to_add = []
 
@@ -518,7 +844,8 @@ async def update_claim_and_media(
                 "claim_id": claim_id,
                 "uploaded_by_user_id": edited_by_user_id,
                 "storage_path": public_url,  # <--- Use the public_url here
-                "description": description
+                "description": description,
+                "quality_score": quality_reports[index]["quality_score"]
             })
             
         except Exception as e:
@@ -568,6 +895,9 @@ async def update_claim_and_media(
         if db_media_entries_to_add:
             added_media_response = supabase.table("claim_media").insert(db_media_entries_to_add).execute()
 
+        # The claim may have moved to another customer, so drop both summaries.
+        invalidate_customer_summary(existing_claim.data[0]["customer_id"], customer_id)
+
         # --- 6. (On Success) Delete Old Files from Storage ---
         # (This logic is unchanged)
         # if storage_paths_to_delete:
@@ -666,6 +996,8 @@ def delete_photo(media_id: int):
             # This shouldn't happen if step 1 passed, but it's good to check
             raise HTTPException(status_code=404, detail="Failed to delete photo record.")
 
+        invalidate_claim_summary(claim_id)
+
         return {"message": "Photo deleted successfully", "deleted_record": delete_response.data[0]}
     
     except HTTPException as e:
@@ -0,0 +1,145 @@
+# migrate.py
+#
+# Applies the versioned SQL files in migrations/ in order, recording each
+# applied version in the schema_migrations table.
+#
+# Usage:
+#   python migrate.py           Apply pending migrations
+#   python migrate.py status    List applied and pending migrations
+#
+# Connects with the same environment variables as main.py, or DATABASE_URL if set.
+
+import os
+import re
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# Files starting with this marker run outside a transaction, one statement at a
+# time (needed for CREATE INDEX CONCURRENTLY).
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+CONCURRENT_INDEX_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w.\"]+)", re.IGNORECASE
+)
+
+
+def connect(dsn: str = None):
+    load_dotenv()
+    dsn = dsn or os.getenv("DATABASE_URL")
+    if dsn:
+        return psycopg2.connect(dsn)
+    return psycopg2.connect(
+        user=os.getenv("USER"),
+        password=os.getenv("supabase_password"),
+        host=os.getenv("HOST"),
+        port=os.getenv("DB_PORT", os.getenv("PORT")),
+        dbname=os.getenv("DBNAME"),
+    )
+
+
+def available_migrations() -> list:
+    """Returns (version, path) for every migrations/NNNN_name.sql file, in order."""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if filename.endswith(".sql"):
+            migrations.append((filename[:-len(".sql")], os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def applied_versions(conn) -> set:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version    TEXT PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """
+        )
+        cur.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def split_statements(sql: str) -> list:
+    """Splits a migration into statements. Migrations must not use ';' inside literals."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [statement.strip() for statement in "\n".join(lines).split(";") if statement.strip()]
+
+
+def drop_invalid_index(cur, statement: str):
+    """
+    A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind, which
+    IF NOT EXISTS would then skip on the retry. Drops it so it gets rebuilt.
+    """
+    match = CONCURRENT_INDEX_RE.match(statement)
+    if not match:
+        return
+    cur.execute(
+        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+        (match.group(1),)
+    )
+    row = cur.fetchone()
+    if row and row[0]:
+        print(f"Dropping invalid index {match.group(1)} left by an earlier failed build...")
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+def apply_migration(conn, version: str, path: str):
+    with open(path) as f:
+        sql = f.read()
+
+    if sql.startswith(NO_TRANSACTION_MARKER):
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for statement in split_statements(sql):
+                    drop_invalid_index(cur, statement)
+                    cur.execute(statement)
+                cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        finally:
+            conn.autocommit = False
+        return
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def migrate(conn) -> list:
+    """Applies all pending migrations and returns the versions applied."""
+    done = applied_versions(conn)
+    applied = []
+    for version, path in available_migrations():
+        if version in done:
+            continue
+        print(f"Applying {version}...")
+        apply_migration(conn, version, path)
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "up"
+    conn = connect()
+    try:
+        if command == "status":
+            done = applied_versions(conn)
+            for version, _ in available_migrations():
+                print(f"  [{'x' if version in done else ' '}] {version}")
+        elif command == "up":
+            applied = migrate(conn)
+            print(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
+        else:
+            print(f"Unknown command: {command}")
+            sys.exit(2)
+    finally:
+        conn.close()
@@ -0,0 +1,43 @@
+-- Tables used by main.py and photo_agent.py.
+-- IF NOT EXISTS so this can be applied to the existing Supabase database,
+-- where these tables were created by hand. Only the columns this codebase
+-- reads or writes are defined here.
+
+CREATE TABLE IF NOT EXISTS customer (
+    customer_id TEXT PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS car (
+    car_id      TEXT PRIMARY KEY,
+    customer_id TEXT REFERENCES customer (customer_id)
+);
+
+CREATE TABLE IF NOT EXISTS policy (
+    policy_id     TEXT PRIMARY KEY,
+    policy_number TEXT,
+    car_id        TEXT REFERENCES car (car_id)
+);
+
+CREATE TABLE IF NOT EXISTS repair_shop (
+    repair_shop_id TEXT PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS claim (
+    claim_id            TEXT PRIMARY KEY,
+    policy_id           TEXT REFERENCES policy (policy_id),
+    customer_id         TEXT REFERENCES customer (customer_id),
+    date_of_incident    DATE NOT NULL,
+    incident_time       TIME NOT NULL,
+    incident_location   TEXT NOT NULL,
+    description         TEXT,
+    status              TEXT,
+    repair_shop_id_done TEXT REFERENCES repair_shop (repair_shop_id)
+);
+
+CREATE TABLE IF NOT EXISTS claim_media (
+    media_id            BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    claim_id            TEXT NOT NULL REFERENCES claim (claim_id) ON DELETE CASCADE,
+    uploaded_by_user_id INTEGER,
+    storage_path        TEXT NOT NULL,
+    description         TEXT
+);
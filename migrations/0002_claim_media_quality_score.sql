@@ -0,0 +1,4 @@
+-- Quality score written by the ingest quality gate (image_quality.py).
+-- NULL for photos stored before the gate existed.
+
+ALTER TABLE claim_media ADD COLUMN IF NOT EXISTS quality_score REAL;
@@ -0,0 +1,22 @@
+-- migrate: no-transaction
+-- Indexes for the lookups on non-primary-key columns. Built CONCURRENTLY so
+-- applying them doesn't block writes on a live database.
+
+-- fetch_claim_photo_items, claim detail media list and the delete_photo
+-- last-photo count: covering, so they are answered from the index alone.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS claim_media_claim_id_idx
+    ON claim_media (claim_id) INCLUDE (media_id, storage_path, quality_score);
+
+-- /claims/{customer_id}, /claim_car/{customer_id} and the summary's
+-- GROUP BY status / MAX(date_of_incident).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS claim_customer_id_status_idx
+    ON claim (customer_id, status) INCLUDE (date_of_incident);
+
+-- /claim_car/{customer_id} and the summary's car list.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS car_customer_id_idx
+    ON car (customer_id);
+
+-- /claim/{claim_id} policy lookup; policy_id may not be the primary key on
+-- databases created before these migrations.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS policy_policy_id_idx
+    ON policy (policy_id) INCLUDE (car_id, policy_number);
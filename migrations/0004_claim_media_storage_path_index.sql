@@ -0,0 +1,12 @@
+-- migrate: no-transaction
+-- Lets reconcile_storage.py diff bucket listings against claim_media in bulk
+-- without scanning the whole table per batch. storage_path holds either the
+-- relative path or a public URL, so the lookup matches
+--   split_part(storage_path, '/claims-media/', 2) = ANY(...) OR storage_path = ANY(...)
+-- and each side of the OR has its own index.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS claim_media_storage_relative_path_idx
+    ON claim_media (split_part(storage_path, '/claims-media/', 2));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS claim_media_storage_path_idx
+    ON claim_media (storage_path);
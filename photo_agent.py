@@ -2,36 +2,56 @@
 
 import os
 import io
+import json
+import re
 # 1. Use the correct, official library
 import google.generativeai as genai
-from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
 from typing import List
 from PIL import Image
 from dotenv import load_dotenv
 from schemas import DamagedParts
+from rate_limit import analysis_admission
+from gemini_files import file_registry
+from image_quality import assess_images, passes_threshold
 from supabase import create_client, Client
+from sse_starlette.sse import EventSourceResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 
 # --- Setup & Configuration ---
 load_dotenv()
-try:
-    # 2. Configure the library
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-except Exception as e:
-    print(f"Error configuring Google AI Client: {e}")
-    # Handle error appropriately
-
-# 3. Initialize the model directly
-# The 'pip install --upgrade' command from Step 1 ensures 
-# this model name is now recognized.
-model = genai.GenerativeModel('gemini-flash-latest')
-
-try:
-    url: str = os.environ.get("SUPABASE_URL")
-    key: str = os.environ.get("SUPABASE_SERVICE_KEY")
-    supabase: Client = create_client(url, key)
-    print("Supabase client initialized for photo.")
-except Exception as e:
-    print(f"Error initializing Supabase client in photo: {e}")
+
+model = None
+supabase: Client = None
+
+def init_clients():
+    """
+    (Re)creates the Gemini and Supabase clients. Called at import, and again in
+    each gunicorn worker after fork, since gRPC/HTTP connections can't be shared
+    across processes.
+    """
+    global model, supabase
+    try:
+        # 2. Configure the library
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    except Exception as e:
+        print(f"Error configuring Google AI Client: {e}")
+        # Handle error appropriately
+
+    # 3. Initialize the model directly
+    # The 'pip install --upgrade' command from Step 1 ensures 
+    # this model name is now recognized.
+    model = genai.GenerativeModel('gemini-flash-latest')
+
+    try:
+        url: str = os.environ.get("SUPABASE_URL")
+        key: str = os.environ.get("SUPABASE_SERVICE_KEY")
+        supabase = create_client(url, key)
+        print("Supabase client initialized for photo.")
+    except Exception as e:
+        print(f"Error initializing Supabase client in photo: {e}")
+
+init_clients()
 
 # --- Create your ROUTER ---
 router = APIRouter(
@@ -39,100 +59,196 @@ router = APIRouter(
     tags=["Insurance Claims"]
 )
 
+# Prompt shared by the upload-based analysis endpoints
+ANALYSIS_INSTRUCTIONS = [
+    "You are an expert insurance adjuster specializing in auto claims.",
+    "Analyze these images, which are different angles of the SAME damaged vehicle.",
+    "Identify all visibly damaged parts across all images.",
+    "Provide a consolidated list of unique damaged part names and a brief summary.",
+    "Respond ONLY with JSON matching the requested schema.",
+]
+
 # --- Helper Functions (no change) ---
 def prepare_image(image_bytes: bytes) -> List[bytes]:
     try:
         return Image.open(io.BytesIO(image_bytes))
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid image file")
+
+def decode_images(photos: List[bytes]) -> list:
+    """Fully decodes images (Image.open alone only reads the header)."""
+    images = []
+    for image_bytes in photos:
+        img = prepare_image(image_bytes)
+        try:
+            img.load()
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid image file")
+        images.append(img)
+    return images
     
-def fetch_claim_photos(claim_id: str) -> List[bytes]:
+class PartsStreamParser:
     """
-    Fetches all photo files for a given claim_id from Supabase Storage.
-    Returns a list of image bytes.
+    Incremental parser for streamed {"parts": [...]} JSON.
+    feed() takes the next chunk of model output and returns the part names
+    whose string literals have been completed since the last call.
     """
-    
-    # --- IMPORTANT ASSUMPTIONS ---
-    DB_TABLE = "claim_media"       # Table with file paths
-    PATH_COLUMN = "storage_path"      # Column in 'claim_media' with the path
-    STORAGE_BUCKET = "claims-media"  # Name of your Storage bucket
-    # -----------------------------
 
-    print(f"Fetching photo paths for claim_id: {claim_id}")
+    _ARRAY_START = re.compile(r'"parts"\s*:\s*\[')
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None  # Index just past the last consumed array element
+        self.done = False
+
+    def feed(self, chunk: str) -> List[str]:
+        self.buffer += chunk
+        if self.pos is None:
+            match = self._ARRAY_START.search(self.buffer)
+            if not match:
+                return []
+            self.pos = match.end()
+
+        parts = []
+        while not self.done:
+            # Skip whitespace and separators between elements
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n,":
+                self.pos += 1
+            if self.pos >= len(self.buffer):
+                break
+            if self.buffer[self.pos] == "]":
+                self.done = True
+                break
+            if self.buffer[self.pos] != '"':
+                # Not a string element; leave it to the final validation.
+                self.done = True
+                break
+            try:
+                part, end = json.decoder.scanstring(self.buffer, self.pos + 1)
+            except json.JSONDecodeError:
+                break  # String not terminated yet, wait for more output
+            parts.append(part)
+            self.pos = end
+        return parts
+
+# Pillow reports many phone JPEGs as MPO (multi-picture JPEG); Gemini only accepts image/jpeg for them.
+GEMINI_MIME_OVERRIDES = {"MPO": "image/jpeg"}
+
+def image_mime_type(image_bytes: bytes) -> str:
+    """Sniffs the image format from its header (no full decode) and returns its MIME type."""
     try:
-        # Step 1: Query the database for file paths
-        response = supabase.table(DB_TABLE)\
-                           .select(PATH_COLUMN)\
+        image_format = Image.open(io.BytesIO(image_bytes)).format
+        return GEMINI_MIME_OVERRIDES.get(image_format) or Image.MIME[image_format]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+
+def fetch_claim_photo_items(claim_id: str) -> List[dict]:
+    """
+    Fetches the photos of a claim for analysis, skipping ones below the quality
+    threshold. Photos that already have a valid Gemini file handle are not
+    downloaded again; the rest come back with their bytes.
+    Returns a list of {"media_id", "handle"} or {"media_id", "bytes"} dicts.
+    Raises a 422 if the claim has photos but none pass the quality threshold.
+    """
+    STORAGE_BUCKET = "claims-media"
+    path_delimiter = f"/{STORAGE_BUCKET}/"
+
+    try:
+        response = supabase.table("claim_media")\
+                           .select("media_id, storage_path, quality_score")\
                            .eq("claim_id", claim_id)\
                            .execute()
-        print(response.data)
-        
-        if not response.data:
-            print(f"No photos found for claim_id: {claim_id}")
-            return []
-
-        # List of full URLs (e.g., "https://.../claims-media/path/to/file.jpg")
-        full_urls = [item[PATH_COLUMN] for item in response.data]
-        print(f"Found {len(full_urls)} photo URLs.")
-
-        # Step 2: Download each file from Storage
-        photo_bytes_list = []
-        
-        # This is the key to find the relative path
-        path_delimiter = f"/{STORAGE_BUCKET}/" 
-        
-        for url in full_urls:
-            try:
-                # --- THE FIX ---
-                # Split the URL to get the part *after* the bucket name
-                # "https://.../claims-media/path/to/file.jpg" -> "path/to/file.jpg"
-                relative_path = url.split(path_delimiter)[-1]
-                
-                print(f"Downloading relative path: {relative_path}")
-                file_bytes = supabase.storage.from_(STORAGE_BUCKET).download(relative_path)
-                photo_bytes_list.append(file_bytes)
-                
-            except Exception as e:
-                print(f"Error downloading file {url}: {e}")
-        
-        return photo_bytes_list
-
     except Exception as e:
         print(f"Error querying Supabase: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch photo paths.")
-    
-@router.post("/analyze/{claim_id}", response_model=DamagedParts)
+
+    rows = [row for row in response.data if passes_threshold(row.get("quality_score"))]
+    if response.data and not rows:
+        # Distinct from "no photos": the claim has photos, they're just not usable.
+        raise HTTPException(status_code=422, detail="All photos for this claim failed the image quality gate.")
+    if len(rows) < len(response.data):
+        print(f"Skipping {len(response.data) - len(rows)} photos of claim {claim_id} below the quality threshold.")
+
+    items = []
+    for row in rows:
+        handle = file_registry.lookup(row["media_id"])
+        if handle is not None:
+            items.append({"media_id": row["media_id"], "handle": handle})
+            continue
+        try:
+            relative_path = row["storage_path"].split(path_delimiter)[-1]
+            file_bytes = supabase.storage.from_(STORAGE_BUCKET).download(relative_path)
+            items.append({"media_id": row["media_id"], "bytes": file_bytes})
+        except Exception as e:
+            print(f"Error downloading file {row['storage_path']}: {e}")
+    return items
+
+def build_image_parts(items: List[dict]) -> list:
+    """
+    Turns photo items into prompt parts: uploaded file handles where possible,
+    falling back to inline PIL images if the file API upload fails.
+    """
+    parts = []
+    for item in items:
+        if item.get("handle") is not None:
+            parts.append(item["handle"])
+            continue
+        image_bytes = item["bytes"]
+        mime_type = image_mime_type(image_bytes)
+        try:
+            parts.append(file_registry.get_or_upload(image_bytes, mime_type, item.get("media_id")))
+        except Exception as e:
+            print(f"WARNING: Gemini file upload failed, sending image inline: {e}")
+            parts.append(prepare_image(image_bytes))
+    return parts
+
+async def usable_uploads(files: List[UploadFile]) -> List[bytes]:
+    """Reads uploaded images and drops the ones that fail the quality gate."""
+    contents = [await file.read() for file in files]
+    reports = await assess_images(contents)
+    usable = [
+        content for content, report in zip(contents, reports)
+        if report["usable"] and passes_threshold(report["quality_score"])
+    ]
+    if not usable:
+        raise HTTPException(status_code=400, detail="None of the provided images are usable for analysis.")
+    return usable
+
+@router.get("/limiter/stats")
+def get_limiter_stats():
+    """Current admission control state for the analysis endpoints (for monitoring)."""
+    return analysis_admission.stats()
+
+@router.post("/analyze/{claim_id}", response_model=DamagedParts, dependencies=[Depends(analysis_admission)])
 async def analyze_claim_from_supabase(claim_id: str):
     """
     Fetches claim images from Supabase, analyzes them with Gemini,
     and returns a consolidated damage report.
     """
     
-    # Step 1: Fetch the raw photo bytes from Supabase
-    photo_bytes_list = fetch_claim_photos(claim_id)
+    # Step 1: Fetch the photos from Supabase (skipping ones Gemini already has).
+    # The Supabase, file API and Gemini calls below block, so they run in the
+    # threadpool to keep the event loop free for other requests.
+    photo_items = await run_in_threadpool(fetch_claim_photo_items, claim_id)
     
-    if not photo_bytes_list:
+    if not photo_items:
         raise HTTPException(status_code=404, detail="No photos found for this claim ID.")
 
-    print(f"Processing {len(photo_bytes_list)} images from Supabase for claim {claim_id}...")
+    print(f"Processing {len(photo_items)} images from Supabase for claim {claim_id}...")
 
-    # Step 2: Convert bytes to PIL Images for Gemini
-    pil_images = []
-    for img_bytes in photo_bytes_list:
-        pil_images.append(prepare_image(img_bytes))
+    # Step 2: Reference the images by uploaded file handle, uploading new ones once
+    image_parts = await run_in_threadpool(build_image_parts, photo_items)
 
-    # Step 3: Build the prompt (same as before)
+    # Step 3: Build the prompt (same instructions as the streaming variant)
     prompt = [
-        "You are an expert insurance adjuster...",
-        "Analyze these images...",
-        "Provide a consolidated list...",
-        "Respond ONLY with JSON...",
-        *pil_images,
+        *ANALYSIS_INSTRUCTIONS,
+        *image_parts,
     ]
 
     # Step 4: Call Gemini (same as before)
     try:
-        response = model.generate_content(
+        response = await run_in_threadpool(
+            model.generate_content,
             prompt,
             generation_config={
                 "response_mime_type": "application/json",
@@ -145,7 +261,7 @@ async def analyze_claim_from_supabase(claim_id: str):
         raise HTTPException(status_code=500, detail=f"AI analysis failed: {str(e)}")
 
 # --- Your Endpoint (using the original, correct syntax) ---
-@router.post("/analyze", response_model=DamagedParts)
+@router.post("/analyze", response_model=DamagedParts, dependencies=[Depends(analysis_admission)])
 async def analyze_claim_images(files: List[UploadFile] = File(...)):
     """
     Upload multiple car images to get a consolidated damage report.
@@ -155,23 +271,20 @@ async def analyze_claim_images(files: List[UploadFile] = File(...)):
 
     print(f"Processing {len(files)} images...")
 
+    contents = await usable_uploads(files)
     pil_images = []
-    for file in files:
-        content = await file.read()
+    for content in contents:
         pil_images.append(prepare_image(content))
 
     prompt = [
-        "You are an expert insurance adjuster specializing in auto claims.",
-        "Analyze these images, which are different angles of the SAME damaged vehicle.",
-        "Identify all visibly damaged parts across all images.",
-        "Provide a consolidated list of unique damaged part names and a brief summary.",
-        "Respond ONLY with JSON matching the requested schema.",
+        *ANALYSIS_INSTRUCTIONS,
         *pil_images,
     ]
 
     try:
         # 4. This is the correct way to call generate_content
-        response = model.generate_content(
+        response = await run_in_threadpool(
+            model.generate_content,
             prompt,
             generation_config={
                 "response_mime_type": "application/json",
@@ -181,4 +294,76 @@ async def analyze_claim_images(files: List[UploadFile] = File(...)):
         return DamagedParts.model_validate_json(response.text)
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"AI analysis failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"AI analysis failed: {str(e)}")
+
+
+# --- Streaming (SSE) variants ---
+def sse_event(event: str, data) -> dict:
+    return {"event": event, "data": data if isinstance(data, str) else json.dumps(data)}
+
+async def stream_damage_analysis(load_photos, build_parts):
+    """
+    Runs the damage analysis and yields SSE events as it progresses:
+    photos_fetched, photos_prepared, analysis_started, one part event per
+    damaged part as the model streams it, then result (the validated
+    DamagedParts) or error.
+    load_photos() returns the photos and build_parts(photos) their prompt parts.
+    """
+    try:
+        photos = await run_in_threadpool(load_photos)
+        if not photos:
+            yield sse_event("error", {"status_code": 404, "detail": "No photos found."})
+            return
+        yield sse_event("photos_fetched", {"count": len(photos)})
+
+        image_parts = await run_in_threadpool(build_parts, photos)
+        # Images are ready to send: decoded, or uploaded to the Gemini file API.
+        yield sse_event("photos_prepared", {"count": len(image_parts)})
+
+        response = await run_in_threadpool(
+            model.generate_content,
+            [*ANALYSIS_INSTRUCTIONS, *image_parts],
+            generation_config={
+                "response_mime_type": "application/json",
+                "response_schema": DamagedParts
+            },
+            stream=True,
+        )
+        yield sse_event("analysis_started", {})
+
+        parser = PartsStreamParser()
+        async for chunk in iterate_in_threadpool(iter(response)):
+            for part in parser.feed(chunk.text):
+                yield sse_event("part", {"part": part})
+
+        result = DamagedParts.model_validate_json(parser.buffer)
+        yield sse_event("result", result.model_dump_json())
+
+    except HTTPException as e:
+        yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+    except Exception as e:
+        yield sse_event("error", {"status_code": 500, "detail": f"AI analysis failed: {str(e)}"})
+
+@router.post("/analyze_stream/{claim_id}", dependencies=[Depends(analysis_admission)])
+async def stream_claim_analysis_from_supabase(claim_id: str):
+    """
+    Streaming variant of /claim/analyze/{claim_id}: progress and damaged parts
+    are sent as server-sent events while the analysis runs.
+    """
+    return EventSourceResponse(
+        stream_damage_analysis(lambda: fetch_claim_photo_items(claim_id), build_image_parts)
+    )
+
+@router.post("/analyze_stream", dependencies=[Depends(analysis_admission)])
+async def stream_claim_images_analysis(files: List[UploadFile] = File(...)):
+    """
+    Streaming variant of /claim/analyze for uploaded images.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No images provided")
+
+    # Read the uploads up front; the stream may outlive the request body.
+    contents = await usable_uploads(files)
+    return EventSourceResponse(
+        stream_damage_analysis(lambda: contents, decode_images)
+    )
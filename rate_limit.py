@@ -0,0 +1,246 @@
+# rate_limit.py
+#
+# Admission control for the Gemini-backed analysis endpoints:
+#  - a token bucket per API key, per client address when opted in, or shared by
+#    anonymous callers (in-process, or shared via Redis),
+#  - a global concurrency gate with a bounded wait queue.
+# Requests that can't be admitted are shed with 429 + Retry-After.
+
+import asyncio
+import hashlib
+import math
+import os
+import threading
+import time
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+# --- Configuration ---
+RATE_LIMIT_RATE = float(os.getenv("ANALYZE_RATE_PER_MINUTE", "10")) / 60.0  # tokens per second
+RATE_LIMIT_BURST = int(os.getenv("ANALYZE_RATE_BURST", "5"))
+# Concurrency and queue limits are totals for the whole deployment; each
+# worker process gets its share (gunicorn.conf.py exports WEB_CONCURRENCY).
+# Every worker needs at least one slot, so with more workers than the total
+# the effective limit is the worker count.
+WORKER_COUNT = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+TOTAL_MAX_CONCURRENT = int(os.getenv("ANALYZE_MAX_CONCURRENT", "4"))
+TOTAL_MAX_QUEUED = int(os.getenv("ANALYZE_MAX_QUEUED", "16"))
+MAX_CONCURRENT_ANALYSES = max(1, TOTAL_MAX_CONCURRENT // WORKER_COUNT)
+MAX_QUEUED_ANALYSES = max(1, TOTAL_MAX_QUEUED // WORKER_COUNT)
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("ANALYZE_QUEUE_TIMEOUT", "15"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("REDIS_URL")
+# Keep this short: an unresponsive Redis should hit the "admit on backend
+# error" path quickly rather than hold the request until the TCP timeout.
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", "0.5"))
+# Comma-separated API keys issued to clients. Only these are trusted as a
+# rate limit identity.
+ANALYZE_API_KEYS = {key.strip() for key in os.getenv("ANALYZE_API_KEYS", "").split(",") if key.strip()}
+# Callers without a known key get a bucket per client address only when this
+# is enabled, and that address is only meaningful if gunicorn trusts the
+# proxy's X-Forwarded-For (FORWARDED_ALLOW_IPS). Otherwise they all share one
+# anonymous bucket. In production, set ANALYZE_API_KEYS, or enable this
+# together with FORWARDED_ALLOW_IPS.
+RATE_LIMIT_BY_ADDRESS = os.getenv("ANALYZE_RATE_LIMIT_BY_ADDRESS", "false").lower() in ("1", "true", "yes")
+
+for setting, total, per_worker in [
+    ("ANALYZE_MAX_CONCURRENT", TOTAL_MAX_CONCURRENT, MAX_CONCURRENT_ANALYSES),
+    ("ANALYZE_MAX_QUEUED", TOTAL_MAX_QUEUED, MAX_QUEUED_ANALYSES),
+]:
+    if per_worker * WORKER_COUNT > total:
+        print(f"WARNING: {WORKER_COUNT} workers with at least one slot each exceed {setting}={total}; "
+              f"the effective limit is {per_worker * WORKER_COUNT}. "
+              f"Lower WEB_CONCURRENCY or adjust {setting}.")
+
+if RATE_LIMIT_BY_ADDRESS and not os.getenv("FORWARDED_ALLOW_IPS"):
+    print("WARNING: ANALYZE_RATE_LIMIT_BY_ADDRESS is set but FORWARDED_ALLOW_IPS is not; behind a proxy "
+          "every caller has the proxy's address and shares one rate limit bucket.")
+elif not RATE_LIMIT_BY_ADDRESS and not ANALYZE_API_KEYS:
+    print("WARNING: Neither ANALYZE_API_KEYS nor ANALYZE_RATE_LIMIT_BY_ADDRESS is set; all analysis "
+          "callers share one rate limit bucket.")
+
+
+class LocalTokenBuckets:
+    """In-process token buckets. Each worker process gets its own buckets."""
+
+    name = "local"
+    max_keys = 10000
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # key -> (tokens, last_refill)
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> float:
+        """Takes one token for key. Returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+    def _prune(self, now: float):
+        # Buckets that have refilled completely carry no state worth keeping.
+        full_after = self.burst / self.rate
+        self._buckets = {
+            key: (tokens, last) for key, (tokens, last) in self._buckets.items()
+            if now - last < full_after
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": self.name, "tracked_keys": len(self._buckets)}
+
+
+class RedisTokenBuckets:
+    """Token buckets shared by every worker through Redis, updated atomically in a Lua script."""
+
+    name = "redis"
+
+    # KEYS[1] = bucket key; ARGV = rate, burst, now
+    _SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str, rate: float, burst: int, timeout: float = RATE_LIMIT_REDIS_TIMEOUT):
+        import redis  # Optional dependency, only needed for the shared backend
+
+        self.rate = rate
+        self.burst = burst
+        self._client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._take = self._client.register_script(self._SCRIPT)
+
+    def take(self, key: str) -> float:
+        return float(self._take(keys=[f"ratelimit:analyze:{key}"], args=[self.rate, self.burst, time.time()]))
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+def create_bucket_backend():
+    if RATE_LIMIT_REDIS_URL:
+        try:
+            return RedisTokenBuckets(RATE_LIMIT_REDIS_URL, RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+        except Exception as e:
+            print(f"WARNING: Could not use Redis rate limit backend, falling back to in-process: {e}")
+    return LocalTokenBuckets(RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+
+
+class AdmissionController:
+    """
+    Rate limit + concurrency gate, used as a FastAPI dependency with yield
+    so the concurrency slot is held until the response has been sent.
+    """
+
+    def __init__(self, buckets, max_concurrent: int, max_queued: int, queue_timeout: float):
+        self.buckets = buckets
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore = None
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected_rate_limited = 0
+        self.rejected_saturated = 0
+
+    @staticmethod
+    def client_key(request: Request) -> str:
+        """
+        Identifies the caller by a known API key, else by client address if
+        RATE_LIMIT_BY_ADDRESS is enabled, else as the shared anonymous caller.
+        Unknown keys are ignored, otherwise a client could get a fresh bucket
+        on every call just by changing the header.
+        """
+        api_key = request.headers.get("x-api-key")
+        if api_key and api_key in ANALYZE_API_KEYS:
+            return f"key:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
+        if RATE_LIMIT_BY_ADDRESS:
+            return f"ip:{request.client.host if request.client else 'unknown'}"
+        return "anonymous"
+
+    def _reject(self, detail: str, retry_after: float):
+        raise HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def __call__(self, request: Request):
+        # --- 1. Per-client token bucket ---
+        try:
+            # take() may be a Redis round-trip; keep it off the event loop.
+            wait = await run_in_threadpool(self.buckets.take, self.client_key(request))
+        except Exception as e:
+            # A broken shared backend shouldn't take the analysis endpoints down with it.
+            print(f"WARNING: Rate limit backend error, admitting request: {e}")
+            wait = 0.0
+        if wait > 0:
+            self.rejected_rate_limited += 1
+            self._reject("Rate limit exceeded for analysis requests.", wait)
+
+        # --- 2. Global concurrency gate with a bounded queue ---
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        if self.in_flight >= self.max_concurrent and self.queued >= self.max_queued:
+            self.rejected_saturated += 1
+            self._reject("Analysis service is saturated, please retry later.", self.queue_timeout)
+
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_saturated += 1
+            self._reject("Timed out waiting for an analysis slot, please retry later.", self.queue_timeout)
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "rejected_rate_limited": self.rejected_rate_limited,
+            "rejected_saturated": self.rejected_saturated,
+            "rate_per_second": self.buckets.rate,
+            "burst": self.buckets.burst,
+            "buckets": self.buckets.stats(),
+        }
+
+
+analysis_admission = AdmissionController(
+    create_bucket_backend(),
+    max_concurrent=MAX_CONCURRENT_ANALYSES,
+    max_queued=MAX_QUEUED_ANALYSES,
+    queue_timeout=QUEUE_TIMEOUT_SECONDS,
+)
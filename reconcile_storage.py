@@ -0,0 +1,198 @@
+# reconcile_storage.py
+#
+# Finds and removes orphaned objects in the claims-media bucket: files that
+# no claim_media row points to (left behind by failed rollbacks, failed
+# removes in delete_photo, or replaced media).
+#
+# The bucket is listed page by page, each page is diffed against
+# claim_media.storage_path (a relative path or public URL) in one query, and
+# orphans are removed in batched calls. Progress is checkpointed after every
+# page, so a run can be stopped (or bounded with --max-pages) and resumed later.
+#
+# Usage:
+#   python reconcile_storage.py --dry-run      Report orphans without removing them
+#   python reconcile_storage.py                Remove orphans
+#   python reconcile_storage.py --max-pages 50 Process at most 50 pages, then checkpoint
+#   python reconcile_storage.py --reset        Discard the checkpoint and start over
+
+import argparse
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+from migrate import connect
+
+BUCKET_NAME = "claims-media"
+STORAGE_PATH_DELIMITER = f"/{BUCKET_NAME}/"
+ROOT_PREFIX = os.getenv("RECONCILE_ROOT_PREFIX", "claims")
+PAGE_SIZE = int(os.getenv("RECONCILE_PAGE_SIZE", "1000"))
+REMOVE_BATCH_SIZE = int(os.getenv("RECONCILE_REMOVE_BATCH_SIZE", "100"))
+# Objects younger than this may belong to an upload whose DB insert hasn't happened yet.
+MIN_AGE = timedelta(hours=int(os.getenv("RECONCILE_MIN_AGE_HOURS", "24")))
+CHECKPOINT_FILE = os.getenv("RECONCILE_CHECKPOINT_FILE", ".reconcile_storage_checkpoint.json")
+PLACEHOLDER_NAME = ".emptyFolderPlaceholder"
+
+
+class StorageReconciler:
+    def __init__(self, supabase, conn, dry_run: bool, checkpoint_file: str = CHECKPOINT_FILE):
+        self.bucket = supabase.storage.from_(BUCKET_NAME)
+        self.conn = conn
+        self.dry_run = dry_run
+        self.checkpoint_file = checkpoint_file
+        self.cutoff = datetime.now(timezone.utc) - MIN_AGE
+        self.checkpoint = self._load_checkpoint()
+
+    # --- Checkpointing ---
+    def _load_checkpoint(self) -> dict:
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file) as f:
+                return json.load(f)
+        return {"root_offset": 0, "last_folder": None, "scanned": 0, "orphans": 0, "removed": 0}
+
+    def _save_checkpoint(self):
+        tmp_path = f"{self.checkpoint_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_file)
+
+    # --- Listing ---
+    def _list_page(self, prefix: str, offset: int) -> list:
+        return self.bucket.list(prefix, {
+            "limit": PAGE_SIZE,
+            "offset": offset,
+            "sortBy": {"column": "name", "order": "asc"},
+        })
+
+    def _is_old_enough(self, item: dict) -> bool:
+        created_at = item.get("created_at")
+        if not created_at:
+            return False
+        return datetime.fromisoformat(created_at.replace("Z", "+00:00")) < self.cutoff
+
+    # --- Diff + removal ---
+    def _referenced_paths(self, paths: list) -> set:
+        """
+        Returns the paths that some claim_media row points to. storage_path holds
+        either the relative path or a public URL; URLs are matched on the part
+        after /claims-media/, the same way delete_photo and the photo fetch resolve them.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT split_part(storage_path, %(delimiter)s, 2), storage_path
+                FROM claim_media
+                WHERE split_part(storage_path, %(delimiter)s, 2) = ANY(%(paths)s) OR storage_path = ANY(%(paths)s)
+                """,
+                {"delimiter": STORAGE_PATH_DELIMITER, "paths": list(paths)}
+            )
+            referenced = {relative_path or storage_path for relative_path, storage_path in cur.fetchall()}
+        self.conn.rollback()  # Read-only; don't hold a transaction open between pages
+        return referenced
+
+    def _reconcile_files(self, paths: list) -> int:
+        """Removes the unreferenced paths and returns how many were removed."""
+        if not paths:
+            return 0
+        self.checkpoint["scanned"] += len(paths)
+        orphans = sorted(set(paths) - self._referenced_paths(paths))
+        self.checkpoint["orphans"] += len(orphans)
+
+        for path in orphans:
+            print(f"{'[dry-run] ' if self.dry_run else ''}Orphan: {path}")
+        if self.dry_run:
+            return 0
+
+        removed = 0
+        for start in range(0, len(orphans), REMOVE_BATCH_SIZE):
+            batch = orphans[start:start + REMOVE_BATCH_SIZE]
+            try:
+                self.bucket.remove(batch)
+                removed += len(batch)
+            except Exception as e:
+                print(f"Warning: Failed to remove {len(batch)} orphaned objects: {e}")
+        self.checkpoint["removed"] += removed
+        return removed
+
+    def _reconcile_page(self, prefix: str, page: list) -> tuple:
+        """Reconciles the files on one listing page. Returns (removed count, sub-folder names)."""
+        files, folders = [], []
+        for item in page:
+            if item.get("id") is None:
+                folders.append(item["name"])
+            elif item["name"] != PLACEHOLDER_NAME and self._is_old_enough(item):
+                files.append(f"{prefix}/{item['name']}")
+        return self._reconcile_files(files), folders
+
+    def _reconcile_prefix(self, prefix: str) -> int:
+        """
+        Reconciles everything under a sub-folder (claims/<claim_id>/...).
+        Returns how many entries are left in it; folders with none left
+        disappear from their parent's listing.
+        """
+        offset = 0
+        while True:
+            page = self._list_page(prefix, offset)
+            if not page:
+                return offset
+            removed, folders = self._reconcile_page(prefix, page)
+            for folder in folders:
+                if self._reconcile_prefix(f"{prefix}/{folder}") == 0:
+                    removed += 1
+            # Removed entries sorted before the next page, so it starts that much earlier.
+            offset += len(page) - removed
+
+    def run(self, max_pages: int = None) -> bool:
+        """Processes root pages from the checkpoint on. Returns True when the whole bucket is done."""
+        pages = 0
+        while max_pages is None or pages < max_pages:
+            offset = self.checkpoint["root_offset"]
+            page = self._list_page(ROOT_PREFIX, offset)
+            if not page:
+                return True
+
+            removed, folders = self._reconcile_page(ROOT_PREFIX, page)
+            for folder in folders:
+                if self.checkpoint["last_folder"] is not None and folder <= self.checkpoint["last_folder"]:
+                    continue  # Done in an earlier, interrupted run
+                if self._reconcile_prefix(f"{ROOT_PREFIX}/{folder}") == 0:
+                    removed += 1
+                self.checkpoint["last_folder"] = folder
+                self._save_checkpoint()
+
+            self.checkpoint["root_offset"] = offset + len(page) - removed
+            self._save_checkpoint()
+            pages += 1
+            print(f"Page {pages} done: {self.checkpoint['scanned']} scanned, "
+                  f"{self.checkpoint['orphans']} orphans, {self.checkpoint['removed']} removed so far.")
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove orphaned objects from the claims-media bucket.")
+    parser.add_argument("--dry-run", action="store_true", help="Report orphans without removing them.")
+    parser.add_argument("--max-pages", type=int, default=None, help="Stop after this many root listing pages.")
+    parser.add_argument("--reset", action="store_true", help="Discard the checkpoint and start from the beginning.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    # Dry runs keep their own checkpoint so they never make a real run skip pages.
+    checkpoint_file = f"{CHECKPOINT_FILE}.dry-run" if args.dry_run else CHECKPOINT_FILE
+    if args.reset and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+    conn = connect()
+    try:
+        reconciler = StorageReconciler(supabase, conn, dry_run=args.dry_run, checkpoint_file=checkpoint_file)
+        finished = reconciler.run(max_pages=args.max_pages)
+    finally:
+        conn.close()
+
+    stats = reconciler.checkpoint
+    print(f"\n--- {'Finished' if finished else 'Paused, run again to resume'} ---")
+    print(f"  Scanned: {stats['scanned']}  Orphans: {stats['orphans']}  Removed: {stats['removed']}")
+    if finished and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The app modules live at the repo root and build their clients at import.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test.test.test")
@@ -0,0 +1,87 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+from PIL import Image
+
+import photo_agent
+from gemini_files import GeminiFileRegistry
+
+
+class FakeFile:
+    def __init__(self, name, expiration_time):
+        self.name = name
+        self.expiration_time = expiration_time
+
+
+class FakeFileAPI:
+    """Local stand-in for genai.upload_file that records every upload."""
+
+    def __init__(self, lifetime=timedelta(hours=48), fail=False):
+        self.lifetime = lifetime
+        self.fail = fail
+        self.uploads = []
+
+    def __call__(self, image_bytes, mime_type, display_name):
+        if self.fail:
+            raise RuntimeError("file API unavailable")
+        self.uploads.append((display_name, mime_type, len(image_bytes)))
+        return FakeFile(f"files/{len(self.uploads)}", datetime.now(timezone.utc) + self.lifetime)
+
+
+def jpeg_bytes(color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_repeat_lookups_reuse_the_uploaded_handle():
+    fake = FakeFileAPI()
+    registry = GeminiFileRegistry(upload_file=fake)
+
+    handle = registry.get_or_upload(b"image-1", "image/jpeg", media_id=1)
+    assert registry.lookup(1) is handle
+    assert registry.get_or_upload(b"image-1", "image/jpeg", media_id=2) is handle
+    assert len(fake.uploads) == 1
+    assert registry.stats() == {"files": 1, "uploads": 1, "hits": 2}
+
+
+def test_handles_near_expiry_are_uploaded_again():
+    # Expires inside the registry's safety margin, so it's never served.
+    fake = FakeFileAPI(lifetime=timedelta(minutes=1))
+    registry = GeminiFileRegistry(upload_file=fake, expiry_margin=timedelta(minutes=10))
+
+    first = registry.get_or_upload(b"image-1", "image/jpeg", media_id=1)
+    assert registry.lookup(1) is None
+
+    fake.lifetime = timedelta(hours=48)
+    second = registry.get_or_upload(b"image-1", "image/jpeg", media_id=1)
+    assert second is not first
+    assert registry.lookup(1) is second
+    assert len(fake.uploads) == 2
+
+
+def test_upload_failure_falls_back_to_inline_image(monkeypatch):
+    monkeypatch.setattr(photo_agent, "file_registry", GeminiFileRegistry(upload_file=FakeFileAPI(fail=True)))
+
+    parts = photo_agent.build_image_parts([{"media_id": 1, "bytes": jpeg_bytes()}])
+    assert len(parts) == 1
+    assert isinstance(parts[0], Image.Image)
+
+
+def test_build_image_parts_uploads_once_and_reuses_handles(monkeypatch):
+    fake = FakeFileAPI()
+    monkeypatch.setattr(photo_agent, "file_registry", GeminiFileRegistry(upload_file=fake))
+
+    first = photo_agent.build_image_parts([{"media_id": 1, "bytes": jpeg_bytes()}])
+    second = photo_agent.build_image_parts([{"media_id": 1, "handle": photo_agent.file_registry.lookup(1)}])
+    assert first == second
+    assert fake.uploads[0][1] == "image/jpeg"
+    assert len(fake.uploads) == 1
+
+
+def test_mpo_images_are_sent_as_jpeg(monkeypatch):
+    class FakeImage:
+        format = "MPO"
+
+    monkeypatch.setattr(photo_agent.Image, "open", lambda _: FakeImage())
+    assert photo_agent.image_mime_type(b"not-really-an-mpo") == "image/jpeg"
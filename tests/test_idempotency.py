@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from idempotency import LocalIdempotencyStore, request_fingerprint
+
+
+def make_store():
+    return LocalIdempotencyStore(ttl=60, maxsize=100)
+
+
+def test_replay_returns_stored_response():
+    store = make_store()
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        return {"claim": {"claim_id": "CL-1"}}
+
+    async def scenario():
+        first = await store.run("k", "fp", handler)
+        second = await store.run("k", "fp", handler)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == ({"claim": {"claim_id": "CL-1"}}, False)
+    assert second == ({"claim": {"claim_id": "CL-1"}}, True)
+    assert len(calls) == 1
+
+
+def test_concurrent_duplicate_waits_for_in_flight_request():
+    store = make_store()
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"claim": "CL-1"}
+
+    async def scenario():
+        return await asyncio.gather(store.run("k", "fp", handler), store.run("k", "fp", handler))
+
+    results = asyncio.run(scenario())
+    assert sorted(replayed for _, replayed in results) == [False, True]
+    assert len(calls) == 1
+
+
+def test_reused_key_with_different_payload_is_rejected():
+    store = make_store()
+
+    async def handler():
+        return {"claim": "CL-1"}
+
+    async def scenario():
+        await store.run("k", "fp-a", handler)
+        await store.run("k", "fp-b", handler)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(scenario())
+    assert exc_info.value.status_code == 422
+
+
+def test_failed_request_is_not_stored():
+    store = make_store()
+    attempts = []
+
+    async def handler():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise HTTPException(status_code=500, detail="upload failed")
+        return {"claim": "CL-1"}
+
+    async def scenario():
+        with pytest.raises(HTTPException):
+            await store.run("k", "fp", handler)
+        return await store.run("k", "fp", handler)
+
+    assert asyncio.run(scenario()) == ({"claim": "CL-1"}, False)
+
+
+def test_fingerprint_covers_fields_and_file_contents():
+    base = request_fingerprint({"policy_id": "P1"}, [("a.jpg", b"abc")])
+    assert base == request_fingerprint({"policy_id": "P1"}, [("a.jpg", b"abc")])
+    assert base != request_fingerprint({"policy_id": "P2"}, [("a.jpg", b"abc")])
+    assert base != request_fingerprint({"policy_id": "P1"}, [("a.jpg", b"abd")])
+
+
+def make_redis_store():
+    fakeredis = pytest.importorskip("fakeredis")
+    from idempotency import RedisIdempotencyStore
+
+    store = RedisIdempotencyStore("redis://unused", ttl=60, lock_seconds=5)
+    store.poll_interval = 0.01
+    store._client = fakeredis.FakeAsyncRedis()
+    return store
+
+
+def test_redis_store_shares_responses_between_workers():
+    # Two store objects on one Redis stand in for two gunicorn workers.
+    worker_a = make_redis_store()
+    worker_b = make_redis_store()
+    worker_b._client = worker_a._client
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"claim": "CL-1"}
+
+    async def scenario():
+        return await asyncio.gather(worker_a.run("k", "fp", handler), worker_b.run("k", "fp", handler))
+
+    results = asyncio.run(scenario())
+    assert sorted(replayed for _, replayed in results) == [False, True]
+    assert all(result == {"claim": "CL-1"} for result, _ in results)
+    assert len(calls) == 1
+
+
+def test_redis_store_rejects_reused_key_with_different_payload():
+    store = make_redis_store()
+
+    async def handler():
+        return {"claim": "CL-1"}
+
+    async def scenario():
+        await store.run("k", "fp-a", handler)
+        await store.run("k", "fp-b", handler)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(scenario())
+    assert exc_info.value.status_code == 422
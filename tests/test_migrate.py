@@ -0,0 +1,36 @@
+from migrate import drop_invalid_index, split_statements
+
+
+class FakeCursor:
+    def __init__(self, invalid):
+        self.invalid = invalid
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return (self.invalid,)
+
+
+def test_invalid_index_from_failed_build_is_dropped():
+    cur = FakeCursor(invalid=True)
+    drop_invalid_index(cur, "CREATE INDEX CONCURRENTLY IF NOT EXISTS car_customer_id_idx\n    ON car (customer_id)")
+
+    assert cur.executed[0][1] == ("car_customer_id_idx",)
+    assert cur.executed[-1][0] == "DROP INDEX CONCURRENTLY IF EXISTS car_customer_id_idx"
+
+
+def test_valid_index_is_left_alone():
+    cur = FakeCursor(invalid=False)
+    drop_invalid_index(cur, "CREATE UNIQUE INDEX CONCURRENTLY policy_policy_id_idx ON policy (policy_id)")
+
+    assert len(cur.executed) == 1
+
+
+def test_other_statements_are_not_checked():
+    cur = FakeCursor(invalid=True)
+    for statement in split_statements("-- comment\nALTER TABLE claim_media ADD COLUMN x REAL;\nCREATE INDEX y ON car (make);"):
+        drop_invalid_index(cur, statement)
+
+    assert cur.executed == []
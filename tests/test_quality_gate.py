@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+import photo_agent
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def execute(self):
+        return type("Response", (), {"data": self.rows})()
+
+
+class FakeBucket:
+    def download(self, path):
+        return b"image-bytes"
+
+
+class FakeStorage:
+    def from_(self, bucket):
+        return FakeBucket()
+
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.storage = FakeStorage()
+
+    def table(self, name):
+        return FakeQuery(self.rows)
+
+
+def media_row(media_id, quality_score):
+    return {"media_id": media_id, "storage_path": f"claims/CL-1/{media_id}.jpg", "quality_score": quality_score}
+
+
+def use_rows(monkeypatch, rows):
+    monkeypatch.setattr(photo_agent, "supabase", FakeSupabase(rows))
+
+
+def test_low_quality_photos_are_skipped(monkeypatch):
+    use_rows(monkeypatch, [media_row(1, 0.9), media_row(2, 0.0), media_row(3, None)])
+
+    items = photo_agent.fetch_claim_photo_items("CL-1")
+    assert [item["media_id"] for item in items] == [1, 3]
+
+
+def test_all_photos_below_threshold_is_a_422(monkeypatch):
+    use_rows(monkeypatch, [media_row(1, 0.0), media_row(2, 0.01)])
+
+    with pytest.raises(HTTPException) as excinfo:
+        photo_agent.fetch_claim_photo_items("CL-1")
+    assert excinfo.value.status_code == 422
+
+
+def test_claim_without_photos_is_still_empty(monkeypatch):
+    use_rows(monkeypatch, [])
+
+    assert photo_agent.fetch_claim_photo_items("CL-1") == []
+
+
+def collect_events(stream):
+    async def collect():
+        return [event async for event in stream]
+    return asyncio.run(collect())
+
+
+def test_stream_reports_failed_quality_gate_as_error_event(monkeypatch):
+    use_rows(monkeypatch, [media_row(1, 0.0)])
+
+    events = collect_events(photo_agent.stream_damage_analysis(
+        lambda: photo_agent.fetch_claim_photo_items("CL-1"), photo_agent.build_image_parts
+    ))
+    assert [event["event"] for event in events] == ["error"]
+    assert json.loads(events[0]["data"])["status_code"] == 422
+
+
+def test_stream_reports_missing_photos_as_404(monkeypatch):
+    use_rows(monkeypatch, [])
+
+    events = collect_events(photo_agent.stream_damage_analysis(
+        lambda: photo_agent.fetch_claim_photo_items("CL-1"), photo_agent.build_image_parts
+    ))
+    assert [event["event"] for event in events] == ["error"]
+    assert json.loads(events[0]["data"])["status_code"] == 404
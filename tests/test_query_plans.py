@@ -0,0 +1,168 @@
+# Query-plan regression checks for the hot lookups in main.py / photo_agent.py.
+# Applies the migrations to a scratch Postgres, loads synthetic data at scale,
+# then runs EXPLAIN ANALYZE on each endpoint's query and checks that it uses
+# the expected index and stays within its latency budget.
+#
+# Skipped unless PLAN_CHECK_DSN points at a local, disposable database:
+#   PLAN_CHECK_DSN=postgresql://postgres@localhost/magicclaim_plans python -m pytest tests/test_query_plans.py
+#
+# Scale with PLAN_CHECK_CUSTOMERS (default 20000); each customer gets
+# 10 claims with 4 photos each.
+
+import os
+
+import pytest
+
+from migrate import connect, migrate
+
+PLAN_CHECK_DSN = os.getenv("PLAN_CHECK_DSN")
+pytestmark = pytest.mark.skipif(not PLAN_CHECK_DSN, reason="PLAN_CHECK_DSN is not set")
+
+CUSTOMERS = int(os.getenv("PLAN_CHECK_CUSTOMERS", "20000"))
+CLAIMS = CUSTOMERS * 10
+MEDIA = CLAIMS * 4
+LATENCY_BUDGET_MS = float(os.getenv("PLAN_CHECK_BUDGET_MS", "5"))
+
+INDEX_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+# (name, query, params, expected index, tables that must not be seq-scanned)
+HOT_QUERIES = [
+    (
+        "fetch_claim_photo_items",
+        "SELECT media_id, storage_path, quality_score FROM claim_media WHERE claim_id = %s",
+        ("CL-42",), "claim_media_claim_id_idx", {"claim_media"},
+    ),
+    (
+        "delete_photo last-photo count",
+        "SELECT COUNT(media_id) FROM claim_media WHERE claim_id = %s",
+        ("CL-42",), "claim_media_claim_id_idx", {"claim_media"},
+    ),
+    (
+        "/claims/{customer_id}",
+        "SELECT claim_id, policy_id, customer_id, date_of_incident, incident_time, incident_location, "
+        "description, status, repair_shop_id_done FROM claim WHERE customer_id = %s",
+        ("CUST-42",), "claim_customer_id_status_idx", {"claim"},
+    ),
+    (
+        "/claim_car/{customer_id} cars",
+        "SELECT * FROM car WHERE customer_id = %s",
+        ("CUST-42",), "car_customer_id_idx", {"car"},
+    ),
+    (
+        "/claim/{claim_id} policy",
+        "SELECT car_id, policy_number FROM policy WHERE policy_id = %s",
+        ("POL-42",), None, {"policy"},
+    ),
+    (
+        "summary claims by status",
+        "SELECT COALESCE(status, 'unknown'), COUNT(*), MAX(date_of_incident) "
+        "FROM claim WHERE customer_id = %s GROUP BY 1",
+        ("CUST-42",), "claim_customer_id_status_idx", {"claim"},
+    ),
+    (
+        "summary media per claim",
+        "SELECT c.claim_id, COUNT(m.media_id) FROM claim c "
+        "LEFT JOIN claim_media m ON m.claim_id = c.claim_id "
+        "WHERE c.customer_id = %s GROUP BY c.claim_id",
+        ("CUST-42",), "claim_media_claim_id_idx", {"claim", "claim_media"},
+    ),
+    (
+        "reconcile_storage referenced paths",
+        "SELECT split_part(storage_path, '/claims-media/', 2), storage_path FROM claim_media "
+        "WHERE split_part(storage_path, '/claims-media/', 2) = ANY(%s) OR storage_path = ANY(%s)",
+        (["claims/CL-2/" + "0" * 32 + ".jpg"], ["claims/CL-3/" + "0" * 32 + ".jpg"]),
+        "claim_media_storage_relative_path_idx", {"claim_media"},
+    ),
+]
+
+
+def load_synthetic_data(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM claim)")
+        if cur.fetchone()[0]:
+            return  # Reuse the data from an earlier run
+
+        params = {"customers": CUSTOMERS, "claims": CLAIMS, "media": MEDIA}
+        cur.execute("INSERT INTO customer SELECT 'CUST-' || g FROM generate_series(1, %(customers)s) g", params)
+        cur.execute("INSERT INTO car SELECT 'CAR-' || g, 'CUST-' || g FROM generate_series(1, %(customers)s) g", params)
+        cur.execute(
+            "INSERT INTO policy SELECT 'POL-' || g, 'PN-' || g, 'CAR-' || g FROM generate_series(1, %(customers)s) g",
+            params
+        )
+        cur.execute("INSERT INTO repair_shop SELECT 'SHOP-' || g FROM generate_series(1, 100) g")
+        cur.execute(
+            """
+            INSERT INTO claim
+            SELECT 'CL-' || g,
+                   'POL-' || (g %% %(customers)s + 1),
+                   'CUST-' || (g %% %(customers)s + 1),
+                   DATE '2020-01-01' + (g %% 2000),
+                   TIME '00:00' + (g %% 86400) * INTERVAL '1 second',
+                   'Synthetic location',
+                   NULL,
+                   (ARRAY['draft', 'active', 'closed'])[g %% 3 + 1],
+                   'SHOP-' || (g %% 100 + 1)
+            FROM generate_series(1, %(claims)s) g
+            """,
+            params
+        )
+        cur.execute(
+            """
+            INSERT INTO claim_media (claim_id, uploaded_by_user_id, storage_path, description, quality_score)
+            SELECT 'CL-' || (g %% %(claims)s + 1),
+                   g %% 50,
+                   CASE WHEN g %% 2 = 0 THEN 'https://example.supabase.co/storage/v1/object/public/claims-media/'
+                        ELSE '' END || 'claims/CL-' || (g %% %(claims)s + 1) || '/' || md5(g::text) || '.jpg',
+                   NULL,
+                   random()
+            FROM generate_series(1, %(media)s) g
+            """,
+            params
+        )
+    conn.commit()
+
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("VACUUM ANALYZE")
+    conn.autocommit = False
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+@pytest.fixture(scope="module")
+def plan_cursor():
+    conn = connect(PLAN_CHECK_DSN)
+    try:
+        migrate(conn)
+        load_synthetic_data(conn)
+        with conn.cursor() as cur:
+            yield cur
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize(
+    "query, params, expected_index, no_seq_scan",
+    [check[1:] for check in HOT_QUERIES],
+    ids=[check[0] for check in HOT_QUERIES],
+)
+def test_query_plan(plan_cursor, query, params, expected_index, no_seq_scan):
+    plan_cursor.execute(query, params)  # Warm the cache before measuring
+    plan_cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, params)
+    explain = plan_cursor.fetchone()[0][0]
+    nodes = list(plan_nodes(explain["Plan"]))
+
+    seq_scanned = {node.get("Relation Name") for node in nodes if node["Node Type"] == "Seq Scan"} & no_seq_scan
+    assert not seq_scanned, f"sequential scan on {', '.join(sorted(seq_scanned))}"
+    used_indexes = {node.get("Index Name") for node in nodes if node["Node Type"] in INDEX_NODES}
+    assert used_indexes, "no index scan"
+    if expected_index:
+        assert expected_index in used_indexes, f"expected {expected_index}, used {sorted(i for i in used_indexes if i)}"
+    assert explain["Execution Time"] <= LATENCY_BUDGET_MS, (
+        f"{explain['Execution Time']:.2f} ms is over the {LATENCY_BUDGET_MS} ms budget"
+    )
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import rate_limit
+from rate_limit import AdmissionController, LocalTokenBuckets, RedisTokenBuckets
+
+
+def make_request(host="10.0.0.1", headers=None):
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/claim/analyze",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "client": (host, 1234),
+    })
+
+
+def admit(controller, request):
+    """Runs the admission dependency up to its yield, like FastAPI does."""
+    async def scenario():
+        gate = controller(request)
+        await gate.__anext__()
+        await gate.aclose()
+    asyncio.run(scenario())
+
+
+def make_controller(buckets):
+    return AdmissionController(buckets, max_concurrent=2, max_queued=2, queue_timeout=1)
+
+
+def test_bucket_exhaustion_is_a_429():
+    controller = make_controller(LocalTokenBuckets(rate=0.01, burst=1))
+
+    admit(controller, make_request())
+    with pytest.raises(HTTPException) as excinfo:
+        admit(controller, make_request())
+    assert excinfo.value.status_code == 429
+    assert "Retry-After" in excinfo.value.headers
+
+
+def test_unreachable_redis_admits_instead_of_hanging():
+    # Nothing listens on port 1, so the bucket lookup fails fast and is admitted.
+    buckets = RedisTokenBuckets("redis://127.0.0.1:1/0", rate=1, burst=1, timeout=0.2)
+    connection_kwargs = buckets._client.connection_pool.connection_kwargs
+    assert connection_kwargs["socket_timeout"] == 0.2
+    assert connection_kwargs["socket_connect_timeout"] == 0.2
+
+    controller = make_controller(buckets)
+    admit(controller, make_request())
+    assert controller.rejected_rate_limited == 0
+
+
+def test_unkeyed_callers_share_a_bucket_unless_address_limiting_is_enabled(monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_BY_ADDRESS", False)
+    assert AdmissionController.client_key(make_request("10.0.0.1")) == "anonymous"
+    assert AdmissionController.client_key(make_request("10.0.0.2")) == "anonymous"
+
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_BY_ADDRESS", True)
+    assert AdmissionController.client_key(make_request("10.0.0.1")) == "ip:10.0.0.1"
+
+
+def test_only_issued_api_keys_get_their_own_bucket(monkeypatch):
+    monkeypatch.setattr(rate_limit, "ANALYZE_API_KEYS", {"issued-key"})
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_BY_ADDRESS", False)
+
+    assert AdmissionController.client_key(make_request(headers={"X-Api-Key": "issued-key"})).startswith("key:")
+    assert AdmissionController.client_key(make_request(headers={"X-Api-Key": "made-up"})) == "anonymous"
@@ -0,0 +1,66 @@
+from reconcile_storage import StorageReconciler
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        # Mirrors the WHERE clause: match on the part after /claims-media/, or the whole value.
+        paths = self.executed[-1][1]["paths"]
+        matched = []
+        for storage_path in self.rows:
+            relative_path = storage_path.split("/claims-media/", 1)[1] if "/claims-media/" in storage_path else ""
+            if relative_path in paths or storage_path in paths:
+                matched.append((relative_path, storage_path))
+        return matched
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.cursor_ = FakeCursor(rows)
+
+    def cursor(self):
+        return self.cursor_
+
+    def rollback(self):
+        pass
+
+
+class FakeStorage:
+    def from_(self, bucket):
+        return object()
+
+
+def make_reconciler(rows, tmp_path):
+    supabase = type("Supabase", (), {"storage": FakeStorage()})()
+    return StorageReconciler(supabase, FakeConnection(rows), dry_run=True,
+                             checkpoint_file=str(tmp_path / "checkpoint.json"))
+
+
+def test_public_urls_from_any_host_count_as_references(tmp_path):
+    reconciler = make_reconciler([
+        "https://old-project.supabase.co/storage/v1/object/public/claims-media/claims/CL-1/a.jpg",
+        "claims/CL-1/b.jpg",
+    ], tmp_path)
+
+    referenced = reconciler._referenced_paths(["claims/CL-1/a.jpg", "claims/CL-1/b.jpg", "claims/CL-1/c.jpg"])
+    assert referenced == {"claims/CL-1/a.jpg", "claims/CL-1/b.jpg"}
+
+
+def test_unreferenced_files_are_reported_as_orphans(tmp_path):
+    reconciler = make_reconciler(["https://x.supabase.co/storage/v1/object/public/claims-media/claims/CL-1/a.jpg"],
+                                 tmp_path)
+
+    reconciler._reconcile_files(["claims/CL-1/a.jpg", "claims/CL-1/orphan.jpg"])
+    assert reconciler.checkpoint["orphans"] == 1